@@ -14,12 +14,13 @@ from quantiles import ten_percentiles
 from torus import generate_R_samples
 
 """
-We will save the data in a csv file.
+We will save the data in a binary file of float64 values
+(use a filename not ending in .bin to save them as text instead).
 Choose a set of parameters for the simulation,
 how closely we want to estimate the quantiles,
 and the batch size (i.e. how often we will save the samples to the file)
 """
-filename = 'exampledata.csv'
+filename = 'exampledata.bin'
 n,m,d,k = 1000,1000,2,1
 width,confidence = 0.1,0.95
 batch_size = 2000
@@ -31,7 +32,7 @@ for i,q in enumerate(qs):
 
 """
 After ten_percentiles has finished, it will return the percentiles,
-and our csv now contains a lot of samples.
+and our data file now contains a lot of samples.
 
 For the diagrams in the paper, we took width=0.1 and confidence=0.95,
 apart from the diagram generated using BinsideA.py (the top-left
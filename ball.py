@@ -18,14 +18,28 @@ from scipy.stats import poisson
 from scipy.integrate import quad
 from tqdm import tqdm
 import sys
-from numba import jit
+import math
+import functools
+from numba import jit, prange, get_num_threads, typed
+
+# The random number generator used by the samplers in this file.
+_rng = np.random.default_rng()
 
 # Derived quantities
+@functools.lru_cache(maxsize=None)
 def theta(d):
     """
     Returns the volume of the d-dimensional unit ball.
     """
-    return np.pi**(d/2) / np.math.gamma(d/2 + 1)
+    return math.pi**(d/2) / math.gamma(d/2 + 1)
+
+@functools.lru_cache(maxsize=None)
+def _inv_factorial(k):
+    """
+    Returns 1/(k-1)!.
+    """
+    # exp(-lgamma(k)) = 1/(k-1)!, without overflowing for large k.
+    return math.exp(-math.lgamma(k))
 
 def c_dk(d,k):
     if k==1:
@@ -34,46 +48,73 @@ def c_dk(d,k):
         else:
             return (1/theta(d-1)) * (theta(d)/(2 - 2/d))**(1 - 1/d)
     else:
-        return (theta(d)**(1 - 1/d) * (1 - 1/d)**(k-2+ 1/d))/(np.math.factorial(k-1)*2**(1-1/d) * theta(d-1))
+        return (theta(d)**(1 - 1/d) * (1 - 1/d)**(k-2+ 1/d)) * _inv_factorial(k) / (2**(1-1/d) * theta(d-1))
 
 def sigma_A(d):
     # Returns sigma_A when A is the unit ball B(o,1).
     return d * (theta(d)**(1/d))
 
-@jit(nopython=True,parallel=False)
-def sample_point( d, sample_size ):
+@jit(nopython=True,cache=True)
+def _sample_ball_2d( sample_size, rng ):
+    """
+    Chooses a point uniformly in the unit disc.
+    """
+    theta = rng.uniform(0.0, 2*np.pi, size=(sample_size,1))
+    radius_sqrt = np.sqrt(rng.random(size=(sample_size,1)))
+    x = radius_sqrt * np.cos(theta)
+    y = radius_sqrt * np.sin(theta)
+    return np.concatenate((x,y),axis=1)
+
+@jit(nopython=True,cache=True)
+def _sample_ball_low( d, sample_size, rng ):
+    """
+    Chooses a point uniformly in the unit ball, for small d.
+    If d isn't too large then the fastest way to sample a point in the unit ball
+    is to sample points in the box [-1,1]^d
+    and keep the ones which land inside the unit ball.
     """
-    Chooses a point uniformly in the unit ball.
+    # We do this in batches, sized using the acceptance probability theta(d)/2^d,
+    # until we have enough points.
+    samples = np.empty(shape=(sample_size,d))
+    accept_ratio = np.pi**(d/2) / (math.gamma(d/2 + 1) * 2**d)
+    filled = 0
+    while filled < sample_size:
+        batch = int((sample_size - filled)/accept_ratio*1.1) + 16
+        box = rng.uniform(-1.0, 1.0, size=(batch,d))
+        inside = box[(box*box).sum(axis=1) <= 1]
+        accepted = min(inside.shape[0], sample_size - filled)
+        samples[filled:filled+accepted,:] = inside[:accepted,:]
+        filled += accepted
+    return samples
+
+@jit(nopython=True,cache=True)
+def _sample_ball_high( d, sample_size, rng ):
+    """
+    Chooses a point uniformly in the (solid) d-dimensional unit ball
+    using "polar coordinates":
+    We choose a point uniformly on the unit sphere,
+    then multiply it by U^{1/d},
+    where U ~ U[0,1] indep of the point on the sphere.
+    """
+    samples = rng.standard_normal(size=(sample_size,d))
+    norms = np.sqrt((samples*samples).sum(axis=1))
+    samples *= (rng.random(size=sample_size)**(1/d) / norms).reshape((sample_size,1))
+    return samples
+
+@jit(nopython=True,cache=True)
+def sample_point( d, sample_size, rng ):
+    """
+    Chooses a point uniformly in the unit ball,
+    using the numpy Generator rng.
+    Each case is its own cached kernel,
+    so we don't recompile them every time the script is run.
     """
     if d==2:
-        theta = 2*np.pi*np.random.random(size=(sample_size,1))
-        radius_sqrt = np.sqrt(np.random.random(size=(sample_size,1)))
-        x = radius_sqrt * np.cos(theta)
-        y = radius_sqrt * np.sin(theta)
-        samples = np.concatenate((x,y),axis=1)
+        return _sample_ball_2d(sample_size, rng)
     elif d<=4:
-        # If d isn't too large then the fastest way to sample a point in the unit ball
-        # is to repeatedly sample a point in the box [-1,1]^d
-        # until we get a point inside the unit ball.
-        samples = 2*np.random.random(size=(sample_size,d)) - 1
-        for i in range(sample_size):
-            while np.dot(samples[i,:],samples[i,:]) > 1:
-                samples[i,:] = 2*np.random.random(size=d) - 1
+        return _sample_ball_low(d, sample_size, rng)
     else:
-        # uniform sample in the (solid) d-dimensional unit ball
-        # Using "polar coordinates":
-        # We choose a point uniformly on the unit sphere,
-        # then multiply it by U^{1/d},
-        # where U ~ U[0,1] indep of the point on the sphere.
-        samples = np.empty(shape=(sample_size,d))
-        for i in range(sample_size):
-            row = np.empty(d)
-            for j in range(d):
-                row[j] = np.random.normal()
-            row /= np.linalg.norm(row)
-            row *= np.random.random()**(1/d)
-            samples[i,:] = row
-    return samples
+        return _sample_ball_high(d, sample_size, rng)
 
 def limit( beta, tau, d, k, subtract_median = False ):
     """
@@ -183,39 +224,89 @@ def lhs_quantity( R, n, k, d ):
     else:
         return n*np.power(R,d) - (2 - 2/d)*np.log(n) - (2*k - 4 + 2/d)*np.log(np.log(n))
 
-def generate_R_samples(n, m, d, k, number_of_samples=2):
+# Number of points per k-d tree query in _max_kth_distance.
+_QUERY_BLOCK = 4096
+
+@jit(nopython=True,cache=True)
+def _max_kth_distance(Xn, Yn, k, parallel_query=False):
+    """
+    Measures max_j (distance from Y_j to its k-th nearest X_i).
+    If parallel_query is True the k-d tree is queried using all threads.
+    """
+    tree = KDTree(Xn)
+    # We query the Y_j in blocks so the (block, k) array of distances stays in cache.
+    largest = 0.0
+    for start in range(0, Yn.shape[0], _QUERY_BLOCK):
+        block = Yn[start:start+_QUERY_BLOCK]
+        if parallel_query:
+            distances = tree.query_parallel(block,k=k)[0]
+        else:
+            distances = tree.query(block,k=k)[0]
+        largest = max(largest, distances[:,k-1].max())
+    return largest
+
+@jit(nopython=True,cache=True)
+def _max_distance(n, m, d, k, shrinkage_factor, rng, parallel_query=False):
+    """
+    Samples R_{n,m,k} once, using the numpy Generator rng.
+    The n points are placed in B(o,1) and the m points in B(o, shrinkage_factor).
+    """
+    Xn = sample_point(d, n, rng)
+    Yn = shrinkage_factor*sample_point(d, m, rng)
+    return _max_kth_distance(Xn, Yn, k, parallel_query)
+
+@jit(nopython=True,parallel=True,cache=True)
+def _R_samples(n, m, d, k, shrinkage_factor, rngs, scale, offset, power):
+    """
+    Each sample of R_{n,m,k} is independent of the others,
+    so we generate them in parallel.
+    A Generator can't be shared between threads,
+    so rngs is a numba typed List holding an independent Generator for each sample.
+    (We index it with an int64, since the prange index is unsigned.)
+    """
+    number_of_samples = len(rngs)
+    samples = np.empty(number_of_samples)
+    for s in prange(number_of_samples):
+        samples[s] = scale*_max_distance(n, m, d, k, shrinkage_factor, rngs[np.int64(s)])**power + offset
+    return samples
+
+def _lhs_coefficients(transform, lhs_quantity, power, *lhs_params):
+    """
+    lhs_quantity is affine in R^d, so we find its coefficients once
+    and the samplers transform each sample as soon as it is generated,
+    as scale*R**power + offset.
+    If transform is False the coefficients give R itself.
+    """
+    if not transform:
+        return 1.0, 0.0, 1
+    offset = lhs_quantity(0, *lhs_params)
+    scale  = lhs_quantity(1, *lhs_params) - offset
+    return scale, offset, power
+
+def _generate_samples(rng, max_distance, R_samples, number_of_samples, scale, offset, power, *params):
+    """
+    Draws number_of_samples transformed samples,
+    using max_distance(*params, rng, parallel_query) for one sample
+    or R_samples(*params, rngs, scale, offset, power) for all of them in parallel.
+    """
+    if number_of_samples < get_num_threads():
+        # There are too few samples to keep every thread busy,
+        # so instead we generate them one at a time and parallelise the queries.
+        samples = np.empty(number_of_samples)
+        for s in tqdm(range(number_of_samples)):
+            samples[s] = scale*max_distance(*params, rng, True)**power + offset
+        return samples
+    return R_samples(*params, typed.List(rng.spawn(number_of_samples)), scale, offset, power)
+
+def generate_R_samples(n, m, d, k, number_of_samples=2, transform=True):
     """
     Samples from the distribution of the two-sample coverage threshold.
     This function takes up the majority of the runtime.
     It returns lhs_quantity(R_{n,m,k}),
-    not R_{n,m,k} itself.
+    not R_{n,m,k} itself, unless transform=False.
     """
-    samples = np.empty(number_of_samples)
-    progress = tqdm(range(number_of_samples))
-    if k == 1:
-        for s in progress:
-            progress.set_description("Step 1/4: sampling n points")
-            Xn = sample_point(d, n)
-            progress.set_description("Step 2/4: building k-d tree")
-            tree = KDTree(Xn)
-            progress.set_description("Step 3/4: sampling m points")
-            Yn = sample_point(d, m)
-            # Measure max_j min_i d(Y_j, X_i):
-            progress.set_description("Step 4/4: measure distances")
-            distances = tree.query(Yn)[0]
-            samples[s] = np.max( distances )
-    else:
-        for s in progress:
-            progress.set_description("Step 1/4: sampling n points")
-            Xn = sample_point(d, n)
-            progress.set_description("Step 2/4: building k-d tree")
-            tree = KDTree(Xn)
-            progress.set_description("Step 3/4: sampling m points")
-            Yn = sample_point(d, m)
-            progress.set_description("Step 4/4: measure distances")
-            distances = tree.query(Yn,k=k)[0][:,k-1]
-            samples[s] = np.max( distances )
-    return lhs_quantity(samples,n,k,d)
+    scale, offset, power = _lhs_coefficients(transform, lhs_quantity, d, n, k, d)
+    return _generate_samples(_rng, _max_distance, _R_samples, number_of_samples, scale, offset, power, n, m, d, k, 1.0)
 
 if __name__=='__main__':
     # Arguments for the script are: n, tau, d, k, batch_size
@@ -232,7 +323,7 @@ if __name__=='__main__':
         batch_size = 2 # The number of times we will sample R_{n,m}.
     p = 0.1
     # The file contains transformed data, i.e. we've already applied lhs_quantity.
-    filename = f'{d}d-{domain}/n{n}-tau{tau}-k{k}.csv'
+    filename = f'{d}d-{domain}/n{n}-tau{tau}-k{k}.bin'
     
     # subtract_median_diagram(n,tau,d,k,filename=filename,outname=f'median/median-test-{d}d-{domain}-n{n}-tau{tau}-k{k}.png')
     
@@ -1,4 +1,5 @@
 import ball
+from quantiles import load_data
 import numpy as np
 import matplotlib.pyplot as plt
 import sys
@@ -14,6 +15,15 @@ For BinsideA and the square, the final arguments are tau, k, n
 doesn't depend on d).
 """
 
+def plot_empirical_cdf(ax, samples, label="Empirical distribution"):
+    """
+    Plots the empirical cdf of the (sorted) samples on ax.
+    This is a step function jumping by 1/N at each sample,
+    so we plot the scaled indices against the samples directly
+    rather than binning them in a histogram.
+    """
+    ax.plot(samples, np.arange(1, samples.size+1)/samples.size, 'b', linewidth=2, drawstyle='steps-post', label=label)
+
 def plot_diagram(data_location,diagram_filename,xlow,xhigh,title,thm_number,lim_fn,corr_lim_fn,*model_params):
     """
     This function can produce almost all the diagrams.
@@ -25,9 +35,8 @@ def plot_diagram(data_location,diagram_filename,xlow,xhigh,title,thm_number,lim_
     model_params should be either (tau,d,k,n) or (tau,k,n) accordingly.
     """
     fig, ax = plt.subplots()
-    samples = np.genfromtxt(data_location)
-    samples.sort()
-    ax.plot(samples, (np.arange(samples.size)+1)/samples.size, 'b', linewidth=2, label="Empirical distribution")
+    samples = load_data(data_location)
+    plot_empirical_cdf(ax, samples)
     my_range = np.arange(xlow, xhigh, 0.01)
     p_lim = lim_fn(my_range, *model_params[:-1])
     p_cor = corr_lim_fn(my_range, *model_params)
@@ -51,9 +60,8 @@ def limit_diagram(data_location,diagram_filename,xlow,xhigh,title,thm_number,lim
     or (tau,k) (for square.py and BinsideA.py).
     """
     fig, ax = plt.subplots()
-    samples = np.genfromtxt(data_location)
-    samples.sort()
-    ax.plot(samples, (np.arange(samples.size)+1)/samples.size, 'b', linewidth=2, label="Empirical distribution")
+    samples = load_data(data_location)
+    plot_empirical_cdf(ax, samples)
     my_range = np.arange(xlow, xhigh, 0.01)
     p_lim = lim_fn(my_range, *model_params)
     ax.plot(my_range,p_lim,'k--',linewidth=2,label=f'Limiting cdf from Theorem {thm_number}')
@@ -79,9 +87,8 @@ def gamma_diagram(data_location,diagram_filename,xlow,xhigh,title,thm_number,*mo
     We don't specify the functions because everything is in ball.py
     """
     fig, ax = plt.subplots()
-    samples = np.genfromtxt(data_location)
-    samples.sort()
-    ax.plot(samples, (np.arange(samples.size)+1)/samples.size, 'b', linewidth=2, label="Empirical distribution")
+    samples = load_data(data_location)
+    plot_empirical_cdf(ax, samples)
     my_range = np.arange(xlow, xhigh, 0.01)
     p_lim = ball.limit(my_range, *model_params[:-1])
     p_cor = ball.corrected_limit(my_range, *model_params)
@@ -110,10 +117,9 @@ def median0_diagram(data_location,diagram_filename,xlow,xhigh,title,thm_number,*
     model_params should be (tau,d,k,n)
     """
     fig, ax = plt.subplots()
-    samples = np.genfromtxt(data_location)
-    samples.sort()
+    samples = load_data(data_location)
     samples -= np.median(samples)
-    ax.plot(samples, (np.arange(samples.size)+1)/samples.size, 'b', linewidth=2, label="Empirical distribution with median shifted to 0")
+    plot_empirical_cdf(ax, samples, "Empirical distribution with median shifted to 0")
     my_range = np.arange(xlow, xhigh, 0.01)
     p_lim = ball.limit(my_range, *model_params[:-1],True)
     p_cor = ball.corrected_limit(my_range, *model_params,True)
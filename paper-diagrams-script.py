@@ -27,7 +27,7 @@ if __name__=='__main__':
     # This is because for smaller n we seemed to still see
     # a strong boundary effect.
     fileprefix = 'b-inside-a-n1e6-tau1-d2-k1'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 1000000,1,2,1
     m = tau*n
@@ -41,7 +41,7 @@ if __name__=='__main__':
     # Diagram 2:
     # torus, n=10**4, m=n, d=2, k=3
     fileprefix = 'torus-n1e4-tau1-d2-k3'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,1,2,3
     m = tau*n
@@ -55,7 +55,7 @@ if __name__=='__main__':
     # Diagram 3:
     # ball, n=10**4, m=n, d=2, k=1
     fileprefix = 'ball-n1e4-tau1-d2-k1'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,1,2,1
     m = tau*n
@@ -74,7 +74,7 @@ if __name__=='__main__':
     # Diagram 5:
     # square, n=10**4, m=n, d=2, k=1
     fileprefix = 'square-n1e4-tau1-d2-k1'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,1,2,1
     m = tau*n
@@ -88,7 +88,7 @@ if __name__=='__main__':
     # Diagram 6:
     # ball, n=10**4, m=n, d=2, k=2
     fileprefix = 'ball-n1e4-tau1-d2-k2'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,1,2,2
     m = tau*n
@@ -103,7 +103,7 @@ if __name__=='__main__':
     # ball, n=10**4, m=n, d=3, k=1,
     # with gamma
     fileprefix = 'ball-n1e4-tau1-d3-k1'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,1,3,1
     m = tau*n
@@ -118,7 +118,7 @@ if __name__=='__main__':
     # ball, n=10**4, m=100*n, d=3, k=1,
     # with gamma.
     fileprefix = 'ball-n1e4-tau100-d3-k1'
-    datafile = 'data/'+fileprefix+'.csv'
+    datafile = 'data/'+fileprefix+'.bin'
     diagfile = 'diagrams/'+fileprefix+EXT
     n,tau,d,k = 10000,100,3,1
     m = tau*n
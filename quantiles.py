@@ -6,13 +6,58 @@ when we have a sufficiently good estimate for certain quantiles.
 See their article, available at
 https://ora.ox.ac.uk/objects/uuid:4cd0c80b-6d7b-41f5-a4f0-e5dd0cd2515b 
 """
+import os
 import numpy as np
 from scipy.stats import binom
 
 def save_data( filename, samples ):
-    f = open(filename, 'a')
-    for s in samples:
-        f.write(str(s)+'\n')
+    """
+    Appends the samples to filename.
+    If filename ends in .bin the samples are appended as raw float64 values,
+    otherwise they are written as text, one per line.
+    """
+    if filename.endswith('.bin'):
+        with open(filename, 'ab') as f:
+            samples.astype(np.float64).tofile(f)
+    else:
+        with open(filename, 'a') as f:
+            np.savetxt(f, samples)
+
+def save_sorted_copy( filename, samples ):
+    """
+    Saves the sorted samples from filename to filename + '.npz',
+    along with the size of filename,
+    so load_data can check the copy still matches the data file.
+    """
+    np.savez(filename + '.npz', samples=samples, source_size=os.path.getsize(filename))
+
+def load_data( filename, report_copy=False ):
+    """
+    Loads the samples saved in filename, and returns them sorted.
+    If report_copy is True we also return whether they came from the sorted copy.
+    compute_quantiles keeps a sorted copy of all the samples (see save_sorted_copy)
+    which is much faster to load than the data file and doesn't need sorting.
+    We only use it if it is at least as recent as the data file
+    and was saved when the data file had its current size,
+    otherwise we reload the data file.
+    """
+    copy = filename + '.npz'
+    if os.path.exists(copy) and os.path.getmtime(copy) >= os.path.getmtime(filename):
+        with np.load(copy) as saved:
+            if saved['source_size'] == os.path.getsize(filename):
+                samples = saved['samples']
+                # Checking the copy is sorted is much cheaper than sorting it again.
+                if not np.all(samples[1:] >= samples[:-1]):
+                    samples.sort(kind='quicksort')
+                return (samples, True) if report_copy else samples
+        print(f'\nThe sorted copy {copy} does not match {filename}, so we reload {filename}.')
+    if filename.endswith('.bin'):
+        samples = np.fromfile(filename, dtype=np.float64)
+    else:
+        samples = np.loadtxt(filename, ndmin=1)
+    # We only need the order statistics, so an unstable sort is fine.
+    samples.sort(kind='quicksort')
+    return (samples, False) if report_copy else samples
 
 def find_rs(p, sample_size, confidence):
     """
@@ -20,49 +65,30 @@ def find_rs(p, sample_size, confidence):
     such that P( r <= N < s ) > confidence,
     where N is a Binomial(p, max_index+1) random variable.
     
+    p may be an array of probabilities, in which case
+    we return arrays of the corresponding r and s.
+    
     Note on indexing: I've written most of this function to be consistent
     with the notation in Briggs' and Ying's article,
     so r and s are in [1, n] rather than [0,n-1] until the return statement,
     then we subtract 1 from each before returning.
     """
     r,s = binom.interval(confidence,sample_size,p)
-    return (max(int(r)-1,0), int(s)-1)
-
-def insert_new_elements( old_list, new_elements ):
-    """
-    Given two sorted numpy arrays, creates their sorted union
-    by inserting the elements of the second array into the first.
-    It is assumed that both old_list and new_elements are sorted.
-    """
-    merged_list = np.empty(shape=(old_list.size + new_elements.size))
-    i = 0
-    j = 0
-    while i < old_list.size and j < new_elements.size:
-        if old_list[i] < new_elements[j]:
-            merged_list[i+j] = old_list[i]
-            i += 1
-        else:
-            merged_list[i+j] = new_elements[j]
-            j += 1
-    if (i == old_list.size):
-        merged_list[i+j:] = new_elements[j:]
-    else:
-        merged_list[i+j:] = old_list[i:]
-    return merged_list
+    return (np.maximum(np.asarray(r,dtype=int)-1,0), np.asarray(s,dtype=int)-1)
 
-def meets_tolerances(samples, pairs_list, abs_tolerance,rel_tolerance):
+def meets_tolerances(samples, r, s, abs_tolerance,rel_tolerance):
     """
     Checks if the tolerance conditions are met.
-    pairs_list is a list of the pairs (r_k, s_k).
+    r and s are arrays of the indices r_k and s_k.
     samples is assumed to be sorted.
     """
     width = samples[-1] - samples[0]
     tolerance = min(abs_tolerance, rel_tolerance*width)
-    for i,pair in enumerate(pairs_list):
-        r,s = pair
-        if (samples[s] - samples[r] > tolerance):
-            print(f'\nQuantile {i+1} has c.i. ({samples[r]:.3f},{samples[s]:.3f}), width {samples[s]-samples[r]:.4f}, but the tolerance is {tolerance:.4f}')
-            return False
+    too_wide = samples[s] - samples[r] > tolerance
+    if too_wide.any():
+        i = too_wide.argmax()
+        print(f'\nQuantile {i+1} has c.i. ({samples[r[i]]:.3f},{samples[s[i]]:.3f}), width {samples[s[i]]-samples[r[i]]:.4f}, but the tolerance is {tolerance:.4f}')
+        return False
     return True
 
 def compute_quantiles(required_quantiles,abs_tolerance,rel_tolerance,confidence,filename,sampling_function,*model_params):
@@ -78,22 +104,23 @@ def compute_quantiles(required_quantiles,abs_tolerance,rel_tolerance,confidence,
     The parameters are usually n, m, d, k and the batch size.
     """
     try:
-        samples = np.genfromtxt(filename)
-        if len(samples) == 0: # It's possible there's an empty file.
-            samples = sampling_function(*model_params)
-            save_data(filename, samples)
-    except:
+        samples, from_copy = load_data(filename, report_copy=True)
+    except OSError:
+        samples, from_copy = np.empty(0), False
+    if samples.size == 0: # It's possible there's an empty file.
         # If there are no samples, we first generate a few.
         samples = sampling_function(*model_params)
         save_data(filename, samples)
-    samples.sort()
+        samples.sort(kind='quicksort')
+    if not from_copy:
+        # The copy is missing or out of date, so we save it now.
+        save_sorted_copy(filename, samples)
     # Create the (r,s) pairs and check if the tolerance is met.
     # If the batch_size is too small this can cause a problem.
-    pairs_list = [(0,0)]*len(required_quantiles)
-    for i,p in enumerate(required_quantiles):
-        pairs_list[i] = find_rs(p, samples.size, confidence)
+    required_quantiles = np.asarray(required_quantiles)
+    r, s = find_rs(required_quantiles, samples.size, confidence)
     attempts = 1
-    while not meets_tolerances(samples, pairs_list, abs_tolerance,rel_tolerance):
+    while not meets_tolerances(samples, r, s, abs_tolerance,rel_tolerance):
         print(f'\nContinuing the simulation with parameters {model_params}.')
         # If we've not met the tolerances then we generate more samples,
         # then test again.
@@ -101,14 +128,102 @@ def compute_quantiles(required_quantiles,abs_tolerance,rel_tolerance,confidence,
         attempts += 1
         new_samples = sampling_function(*model_params)
         save_data(filename, new_samples)
-        new_samples.sort()
-        samples = insert_new_elements(samples, new_samples)
-        for i,p in enumerate(required_quantiles):
-            pairs_list[i] = find_rs(p,samples.size,confidence)
-    quantiles = np.empty(shape=(len(required_quantiles)))
-    for i, p in enumerate(required_quantiles):
-        quantiles[i] = samples[int(p*samples.size)-1]
-    return quantiles
+        new_samples.sort(kind='quicksort')
+        # samples is already sorted, so we only need to find where each new sample goes.
+        samples = np.insert(samples, np.searchsorted(samples, new_samples), new_samples)
+        save_sorted_copy(filename, samples)
+        r, s = find_rs(required_quantiles, samples.size, confidence)
+    # samples is sorted, so each quantile is a single lookup.
+    return samples[(required_quantiles*samples.size).astype(int)-1]
+
+class P2Quantile:
+    """
+    Estimates the p-th quantile of a stream of samples
+    with the P^2 algorithm of Jain and Chlamtac (1985),
+    which keeps five markers instead of every sample.
+    
+    The markers are at the minimum, the p/2-th, p-th and (1+p)/2-th quantiles,
+    and the maximum. heights holds the marker values
+    and positions holds their (1-indexed) ranks among the samples so far.
+    """
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+
+    def update(self, x):
+        q = self.heights
+        positions = self.positions
+        if len(q) < 5:
+            # The first five samples become the initial markers.
+            q.append(x)
+            q.sort()
+            return
+        # Find the cell q[k] <= x < q[k+1], extending the extreme markers if needed.
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k+1]:
+                k += 1
+        for i in range(k+1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        # Move the middle markers towards their desired positions,
+        # using piecewise-parabolic interpolation if it keeps the heights in order.
+        for i in range(1, 4):
+            step = self.desired[i] - positions[i]
+            if (step >= 1 and positions[i+1] - positions[i] > 1) or (step <= -1 and positions[i-1] - positions[i] < -1):
+                step = 1 if step > 0 else -1
+                parabolic = q[i] + step/(positions[i+1] - positions[i-1]) * (
+                    (positions[i] - positions[i-1] + step)*(q[i+1] - q[i])/(positions[i+1] - positions[i])
+                    + (positions[i+1] - positions[i] - step)*(q[i] - q[i-1])/(positions[i] - positions[i-1]) )
+                if q[i-1] < parabolic < q[i+1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + step*(q[i+step] - q[i])/(positions[i+step] - positions[i])
+                positions[i] += step
+
+    def current(self):
+        """
+        Returns the current estimate of the p-th quantile,
+        or nan if there haven't been any samples yet.
+        """
+        q = self.heights
+        if len(q) == 0:
+            return np.nan
+        if len(q) < 5:
+            return q[max(int(self.p*len(q)) - 1, 0)]
+        return q[2]
+
+def streaming_quantiles(required_quantiles,number_of_batches,filename,sampling_function,*model_params):
+    """
+    Estimates the required quantiles from number_of_batches batches
+    of new samples, using one P2Quantile per quantile,
+    so the samples are never held in memory or sorted.
+    The samples are still appended to filename.
+    
+    This is an opt-in alternative to compute_quantiles (and ten_percentiles),
+    for when a fixed budget of samples is enough: there is no stopping rule,
+    since P^2 does not give a confidence interval for its estimates.
+    If number_of_batches is 0 every estimate is nan.
+    model_params are as for compute_quantiles.
+    """
+    estimators = [P2Quantile(p) for p in required_quantiles]
+    for batch in range(number_of_batches):
+        new_samples = sampling_function(*model_params)
+        save_data(filename, new_samples)
+        for x in new_samples.tolist():
+            for estimator in estimators:
+                estimator.update(x)
+    return np.array([estimator.current() for estimator in estimators])
 
 def ten_percentiles(abs_tolerance,rel_tolerance,confidence,filename,sampling_function,*model_params):
     """
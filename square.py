@@ -3,23 +3,24 @@ Computes R_{n,m,k} in the 2-dimensional square [0,1]^2.
 """
 import numpy as np
 import matplotlib.pyplot as plt
-#from scipy.spatial import KDTree
-from numba_kdtree import KDTree
 from scipy.stats import norm
 from scipy.stats import binom
 from scipy.stats import poisson
 from scipy.integrate import quad
-from tqdm import tqdm
 import sys
-from numba import jit
-from ball import c_dk
+from numba import jit, prange
+from ball import c_dk, _max_kth_distance, _lhs_coefficients, _generate_samples
 
-@jit(nopython=True,parallel=False)
-def sample_point( sample_size ):
+# As ball._rng, for the samplers in this file.
+_rng = np.random.default_rng()
+
+@jit(nopython=True,parallel=False,cache=True)
+def sample_point( sample_size, rng ):
     """
-    Chooses a point uniformly in the square [0,1]^2.
+    Chooses a point uniformly in the square [0,1]^2,
+    using the numpy Generator rng.
     """
-    return np.random.random(size=(sample_size,2))
+    return rng.random(size=(sample_size,2))
 
 def limit( beta, tau, k ):
     """
@@ -66,36 +67,32 @@ def lhs_quantity( R, n, k ):
     else:
         return n*np.pi*f0*np.square(R) - np.log(n) - (2*k - 3)*np.log(np.log(n))
 
-def generate_R_samples(n, m, k, number_of_samples=2):
+# These two kernels aren't cached, since numba would not notice
+# when ball._max_kth_distance changes and would reuse a stale cache.
+@jit(nopython=True)
+def _max_distance(n, m, k, rng, parallel_query=False):
+    """
+    As ball._max_distance, with the points placed in the square.
+    """
+    return _max_kth_distance(sample_point(n, rng), sample_point(m, rng), k, parallel_query)
+
+@jit(nopython=True,parallel=True)
+def _R_samples(n, m, k, rngs, scale, offset, power):
+    """
+    As ball._R_samples, with the points placed in the square.
+    """
+    number_of_samples = len(rngs)
+    samples = np.empty(number_of_samples)
+    for s in prange(number_of_samples):
+        samples[s] = scale*_max_distance(n, m, k, rngs[np.int64(s)])**power + offset
+    return samples
+
+def generate_R_samples(n, m, k, number_of_samples=2, transform=True):
     """
     Produces samples of the two-sample coverage threshold.
     This function takes up the majority of the runtime.
     It returns lhs_quantity(R_{n,m,k}),
-    not R_{n,m,k} itself.
+    not R_{n,m,k} itself, unless transform=False.
     """
-    samples = np.empty(number_of_samples)
-    progress = tqdm(range(number_of_samples))
-    if k == 1:
-        for s in progress:
-            progress.set_description("Step 1/4: sampling n points")
-            Xn = sample_point(n)
-            progress.set_description("Step 2/4: building k-d tree")
-            tree = KDTree(Xn)
-            progress.set_description("Step 3/4: sampling m points")
-            Yn = sample_point(m)
-            # Measure max_j min_i d(Y_j, X_i):
-            progress.set_description("Step 4/4: measure distances")
-            distances = tree.query(Yn)[0]
-            samples[s] = np.max( distances )
-    else:
-        for s in progress:
-            progress.set_description("Step 1/4: sampling n points")
-            Xn = sample_point(n)
-            progress.set_description("Step 2/4: building k-d tree")
-            tree = KDTree(Xn)
-            progress.set_description("Step 3/4: sampling m points")
-            Yn = sample_point(m)
-            progress.set_description("Step 4/4: measure distances")
-            distances = tree.query(Yn,k=k)[0][:,k-1]
-            samples[s] = np.max( distances )
-    return lhs_quantity(samples,n,k)
+    scale, offset, power = _lhs_coefficients(transform, lhs_quantity, 2, n, k)
+    return _generate_samples(_rng, _max_distance, _R_samples, number_of_samples, scale, offset, power, n, m, k)
@@ -8,30 +8,38 @@ from scipy.stats import poisson
 from scipy.integrate import quad
 from tqdm import tqdm
 import sys
-from numba import jit
+from numba import jit, prange, typed
 from itertools import combinations
+from ball import theta, _inv_factorial, _lhs_coefficients
 
-@jit(nopython=True,parallel=False)
-def sample_point( d, sample_size ):
+# As ball._rng, for the samplers in this file.
+_rng = np.random.default_rng()
+
+@jit(nopython=True,parallel=False,cache=True)
+def sample_point( d, sample_size, rng ):
     """
-    Chooses a point uniformly in [0,1]^d.
+    Chooses a point uniformly in [0,1]^d,
+    using the numpy Generator rng.
     """
-    return np.random.random(size=(sample_size,d))
+    return rng.random(size=(sample_size,d))
 
 def limit( beta, tau, d, k ):
     """
     Evaluates the limiting cdf from Theorem 2.1.
     """
-    return np.exp( - tau*np.exp(-beta) / np.math.factorial(k-1) )
+    c = tau * _inv_factorial(k)
+    return np.exp( - c*np.exp(-beta) )
 
 def corrected_limit(beta, tau, d, k, n):
     """
     Returns the "corrected limit" from Theorem 2.1.
     """
-    correction = tau * np.exp(-beta) * (k-1)*(k-1) * np.log(np.log(n)) / ( np.math.factorial(k-1) * np.log(n) )
+    logn = np.log(n)
+    c = tau * (k-1)*(k-1) * np.log(logn) * _inv_factorial(k) / logn
+    correction = c * np.exp(-beta)
     return np.exp(-correction)*limit(beta,tau,d,k)
 
-@jit(nopython=True)
+@jit(nopython=True,cache=True)
 def shift(torus_points,coords):
     shifted = torus_points.copy()
     for i in range(torus_points.shape[0]):
@@ -44,14 +52,15 @@ def lhs_quantity( R, n, k, d ):
     Given R, calculates the random variable whose limit we consider in
     Theorem 2.1.
     """
-    THETA_d = np.pi**(d/2) / np.math.gamma(d/2 + 1)
+    THETA_d = theta(d)
     f0 = 1
-    return n*THETA_d*f0*R**d - np.log(n) - (k-1)*np.log(np.log(n))
+    logn = np.log(n)
+    return n*THETA_d*f0*R**d - logn - (k-1)*np.log(logn)
 
-@jit(nopython=True)
-def generate_Rk(n,m,d,k):
-    Xn = np.random.random(size=(n,d))
-    Ym = np.random.random(size=(m,d))
+@jit(nopython=True,cache=True)
+def generate_Rk(n,m,d,k,rng):
+    Xn = rng.random(size=(n,d))
+    Ym = rng.random(size=(m,d))
     k_nearest_dists = np.empty(m)
     for j, y in enumerate(Ym):
         closest_k = d*np.ones(k)
@@ -78,24 +87,36 @@ def generate_Rk(n,m,d,k):
                         break
                 closest_k[new_pos] = total_distance
         k_nearest_dists[j] = closest_k[-1]
-    return np.sqrt(max(k_nearest_dists))
+    return np.sqrt(k_nearest_dists.max())
 
-def generate_R_samples(n, m, d, k, number_of_samples=2):
+@jit(nopython=True,parallel=True,cache=True)
+def _Rk_samples(n, m, d, k, rngs, scale, offset, power):
+    """
+    As ball._R_samples, using generate_Rk to sample R_{n,m,k}.
+    """
+    number_of_samples = len(rngs)
+    samples = np.empty(number_of_samples)
+    for s in prange(number_of_samples):
+        samples[s] = scale*generate_Rk(n,m,d,k,rngs[np.int64(s)])**power + offset
+    return samples
+
+def generate_R_samples(n, m, d, k, number_of_samples=2, transform=True):
     """
     Produces samples of the two-sample coverage threshold.
     This function takes up the majority of the runtime.
     It returns lhs_quantity(R_{n,m,k}),
-    not R_{n,m,k} itself.
+    not R_{n,m,k} itself, unless transform=False.
     """
-    samples = np.empty(number_of_samples)
-    progress = tqdm(range(number_of_samples))
+    scale, offset, power = _lhs_coefficients(transform, lhs_quantity, d, n, k, d)
     if k == 1:
+        samples = np.empty(number_of_samples)
+        progress = tqdm(range(number_of_samples))
         for s in progress:
-            Xn = sample_point(d, n)
+            Xn = sample_point(d, n, _rng)
             tree_0 = KDTree(Xn)
-            Yn = sample_point(d, m)
+            Yn = sample_point(d, m, _rng)
             # Measure max_j min_i d(Y_j, X_i):
-            distances = tree_0.query(Yn)[0]
+            distances = tree_0.query_parallel(Yn)[0]
             # This is quite a crude method for finding the closest points on a torus:
             # for each subset I of {1,...,d} we shift the points in the square by 0.5 * \sum_{i \in I} e_i,
             # then reduce the coordinates modulo 1, and measure distances in the square.
@@ -108,9 +129,8 @@ def generate_R_samples(n, m, d, k, number_of_samples=2):
                     shifted_Xn   = shift(Xn,choice)
                     shifted_tree = KDTree(shifted_Xn)
                     shifted_Yn   = shift(Yn,choice)
-                    distances = np.minimum(distances, shifted_tree.query(shifted_Yn)[0])
-            samples[s] = np.max( distances )
+                    np.minimum(distances, shifted_tree.query_parallel(shifted_Yn)[0], out=distances)
+            samples[s] = scale*distances.max()**power + offset
     else:
-        for s in progress:
-            samples[s] = generate_Rk(n,m,d,k)
-    return lhs_quantity(samples,n,k,d)
+        samples = _Rk_samples(n, m, d, k, typed.List(_rng.spawn(number_of_samples)), scale, offset, power)
+    return samples